@@ -9,6 +9,82 @@ import time
 
 
 MAX_WORKING_SIZE = 2000  # Working resolution for fast rendering
+REFINE_DELAY_MS = 150    # Idle time before the high-quality re-render
+CLICK_TOLERANCE = 3      # Max press/release movement (px) still counted as a click
+GRID_CELLS = 64          # Spatial index resolution (cells per axis)
+
+# Define class IDs
+ACTUATORS = {29, 30, 31, 32, 33, 34, 35, 74}
+VALVES = {0, 1, 2, 3, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 41, 42, 43, 44, 67, 68, 70, 71, 198, 199, 200}
+
+# Class filter choices (None = show everything)
+CLASS_FILTERS = {
+    "All": None,
+    "Valves": VALVES,
+    "Actuators": ACTUATORS,
+}
+
+
+class BoxGrid:
+    """Uniform grid over normalized image space for fast bbox lookup."""
+
+    def __init__(self, cells=GRID_CELLS):
+        self.cells = cells
+        self.grid = {}              # (cx, cy) -> [box index]
+        self.boxes = []             # (cls, x1, y1, x2, y2) normalized
+
+    def _span(self, x1, y1, x2, y2):
+        n = self.cells
+        cx1 = min(n - 1, max(0, int(x1 * n)))
+        cy1 = min(n - 1, max(0, int(y1 * n)))
+        cx2 = min(n - 1, max(0, int(x2 * n)))
+        cy2 = min(n - 1, max(0, int(y2 * n)))
+        return range(cx1, cx2 + 1), range(cy1, cy2 + 1)
+
+    def insert(self, cls, xc, yc, w, h):
+        """Add a YOLO box and return its index."""
+        idx = len(self.boxes)
+        box = (cls, xc - w/2, yc - h/2, xc + w/2, yc + h/2)
+        self.boxes.append(box)
+
+        xs, ys = self._span(*box[1:])
+        for cx in xs:
+            for cy in ys:
+                self.grid.setdefault((cx, cy), []).append(idx)
+        return idx
+
+    def query(self, x1, y1, x2, y2, classes=None):
+        """Indices of boxes intersecting the rect, optionally class-filtered."""
+        xs, ys = self._span(x1, y1, x2, y2)
+        if len(xs) * len(ys) >= len(self.boxes):
+            # cheaper to scan every box than to walk the cells
+            candidates = range(len(self.boxes))
+        else:
+            candidates = set()
+            for cx in xs:
+                for cy in ys:
+                    candidates.update(self.grid.get((cx, cy), ()))
+
+        hits = []
+        for i in candidates:
+            cls, bx1, by1, bx2, by2 = self.boxes[i]
+            if classes is not None and cls not in classes:
+                continue
+            if bx2 < x1 or bx1 > x2 or by2 < y1 or by1 > y2:
+                continue
+            hits.append(i)
+        return sorted(hits)
+
+    def hit(self, x, y, classes=None):
+        """Index of the smallest box containing the point, or None."""
+        best = None
+        best_area = None
+        for i in self.query(x, y, x, y, classes):
+            _, bx1, by1, bx2, by2 = self.boxes[i]
+            area = (bx2 - bx1) * (by2 - by1)
+            if best is None or area < best_area:
+                best, best_area = i, area
+        return best
 
 
 class FastBBoxViewer:
@@ -30,10 +106,15 @@ class FastBBoxViewer:
         self.pan_x = 0
         self.pan_y = 0
         self.drag_start = None
+        self.click_pos = None
 
         # Throttle
         self.last_render = 0
 
+        # Progressive rendering (cheap while interacting, refine on idle)
+        self.fast = False
+        self.refine_job = None
+
         # Annotation
         self.annotation_mode = False
         self.rect_start = None
@@ -42,9 +123,17 @@ class FastBBoxViewer:
         # Image storage
         self.original = None        # Full resolution (numpy)
         self.working = None         # Scaled (numpy)
-        self.zoomed = None          # Zoomed (numpy)
+        self.zoom_w = 0             # Virtual zoomed size (px), only the
+        self.zoom_h = 0             # viewport part is ever resized
+        self.area_cache = None      # ((zw, zh), image) for zoomed-out refine
         self.tk_image = None
         self.bboxes = []            # (cls, xc, yc, w, h)
+        self.index = BoxGrid()      # spatial index over self.bboxes
+
+        # Selection & filtering
+        self.hovered = None         # bbox index under the cursor
+        self.selected = None        # clicked bbox index
+        self.class_filter = None    # set of visible class ids, None = all
 
         # Canvas
         self.canvas = tk.Canvas(root, bg="gray", cursor="hand2")
@@ -53,6 +142,7 @@ class FastBBoxViewer:
         self.canvas.bind("<B1-Motion>", self.on_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
         self.canvas.bind("<MouseWheel>", self.on_scroll)
+        self.canvas.bind("<Motion>", self.on_motion)
 
         # Controls
         frame = ttk.Frame(root)
@@ -65,12 +155,21 @@ class FastBBoxViewer:
         ttk.Button(frame, text="Reset", command=self.reset_view).pack(side=tk.LEFT)
         ttk.Button(frame, text="Annotate", command=self.toggle_annotate).pack(side=tk.LEFT)
 
+        self.filter_var = tk.StringVar(value="All")
+        filter_box = ttk.Combobox(frame, textvariable=self.filter_var, values=list(CLASS_FILTERS),
+                                  state="readonly", width=10)
+        filter_box.pack(side=tk.LEFT, padx=5)
+        filter_box.bind("<<ComboboxSelected>>", self.on_filter)
+
         self.info = ttk.Label(frame, text="")
         self.info.pack(side=tk.LEFT, padx=20)
 
         self.zoom_label = ttk.Label(frame, text="Zoom: 100%")
         self.zoom_label.pack(side=tk.LEFT)
 
+        self.sel_label = ttk.Label(frame, text="")
+        self.sel_label.pack(side=tk.LEFT, padx=20)
+
         self.load_image()
 
 
@@ -88,10 +187,11 @@ class FastBBoxViewer:
         h, w = self.original.shape[:2]
         scale = MAX_WORKING_SIZE / max(h, w)
         if scale < 1:
-            self.working = cv2.resize(self.original, (int(w * scale), int(h * scale)), cv2.INTER_LINEAR)
+            self.working = cv2.resize(self.original, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
         else:
             self.working = self.original.copy()
 
+        self.area_cache = None
         self.zoom = 1.0
         self.pan_x = 0
         self.pan_y = 0
@@ -100,12 +200,17 @@ class FastBBoxViewer:
         name = os.path.splitext(os.path.basename(img_path))[0]
         label_path = os.path.join(self.label_dir, name + ".txt")
         self.bboxes = []
+        self.index = BoxGrid()
+        self.hovered = None
+        self.set_selected(None)
 
         if os.path.exists(label_path):
             with open(label_path) as f:
                 for line in f:
                     cls, xc, yc, w, h = line.strip().split()
-                    self.bboxes.append((int(cls), float(xc), float(yc), float(w), float(h)))
+                    box = (int(cls), float(xc), float(yc), float(w), float(h))
+                    self.bboxes.append(box)
+                    self.index.insert(*box)
 
         self.info.config(text=f"{self.current_idx+1}/{len(self.image_files)} - {os.path.basename(img_path)}")
         self.apply_zoom()
@@ -115,17 +220,78 @@ class FastBBoxViewer:
     # ZOOM & PAN SYSTEM
     # --------------------------------------------------------------------------
 
-    def apply_zoom(self):
-        """Recompute zoomed working image."""
+    def apply_zoom(self, fast=False):
+        """Update zoomed size and re-render.
+
+        With fast=True the viewport is resized nearest-neighbour and a refine
+        pass is scheduled for when input goes idle.
+        """
         h, w = self.working.shape[:2]
-        zw = int(w * self.zoom)
-        zh = int(h * self.zoom)
-        self.zoomed = cv2.resize(self.working, (zw, zh), cv2.INTER_LINEAR)
+        self.zoom_w = max(1, int(w * self.zoom))
+        self.zoom_h = max(1, int(h * self.zoom))
+
+        self.fast = fast
+        if fast:
+            self.schedule_refine()
+        else:
+            self.cancel_refine()
+
+        self.render_view()
 
+    def schedule_refine(self):
+        """(Re)start the idle timer for the high-quality pass."""
+        self.cancel_refine()
+        self.refine_job = self.root.after(REFINE_DELAY_MS, self.refine_view)
+
+    def cancel_refine(self):
+        if self.refine_job is not None:
+            self.root.after_cancel(self.refine_job)
+            self.refine_job = None
+
+    def refine_view(self):
+        """Idle callback: re-render with the best filter for the zoom level."""
+        self.refine_job = None
+        if self.drag_start is not None:
+            # still panning, wait for the next idle period
+            self.schedule_refine()
+            return
+        self.last_render = 0  # settled frame must not be throttled away
+        self.fast = False
         self.render_view()
 
+    def render_viewport(self, cw, ch):
+        """Render only the part of the zoomed image under the viewport.
+
+        Working px x maps to x * zoom_w / w - pan_x, the same exact scale
+        draw_bboxes uses, so the image never drifts against the overlay.
+        """
+        h, w = self.working.shape[:2]
+        vw = min(cw, self.zoom_w - self.pan_x)
+        vh = min(ch, self.zoom_h - self.pan_y)
+
+        if not self.fast and self.zoom < 1:
+            # INTER_AREA has no warp equivalent: downscale the whole image to
+            # the exact zoomed size (smaller than working) and reuse it while
+            # panning at this zoom
+            size = (self.zoom_w, self.zoom_h)
+            if self.area_cache is None or self.area_cache[0] != size:
+                self.area_cache = (size, cv2.resize(self.working, size, interpolation=cv2.INTER_AREA))
+            zoomed = self.area_cache[1]
+            return zoomed[self.pan_y:self.pan_y+vh, self.pan_x:self.pan_x+vw]
+
+        sx = self.zoom_w / w
+        sy = self.zoom_h / h
+
+        # pixel-centre mapping (same convention as cv2.resize), cost ∝ viewport
+        M = np.float32([[sx, 0, 0.5 * sx - 0.5 - self.pan_x],
+                        [0, sy, 0.5 * sy - 0.5 - self.pan_y]])
+        interp = cv2.INTER_NEAREST if self.fast else cv2.INTER_CUBIC
+
+        return cv2.warpAffine(self.working, M, (vw, vh), flags=interp,
+                              borderMode=cv2.BORDER_REPLICATE)
+
     def render_view(self):
-        """Crop zoomed image based on pan and draw canvas + bboxes."""
+        """Render the viewport at the current pan and draw canvas + bboxes."""
 
         # throttle to ~60 fps
         if time.time() - self.last_render < 0.015:
@@ -139,13 +305,13 @@ class FastBBoxViewer:
             return
 
         # clamp pan
-        max_x = max(0, self.zoomed.shape[1] - cw)
-        max_y = max(0, self.zoomed.shape[0] - ch)
+        max_x = max(0, self.zoom_w - cw)
+        max_y = max(0, self.zoom_h - ch)
         self.pan_x = max(0, min(self.pan_x, max_x))
         self.pan_y = max(0, min(self.pan_y, max_y))
 
         # crop viewport
-        view = self.zoomed[self.pan_y:self.pan_y+ch, self.pan_x:self.pan_x+cw]
+        view = self.render_viewport(cw, ch)
 
         # Convert to Tk image
         pil_img = Image.fromarray(view)
@@ -175,34 +341,36 @@ class FastBBoxViewer:
     # DRAW BBOXES
     # --------------------------------------------------------------------------
     def draw_bboxes(self):
-        """Draw YOLO bboxes scaled to the zoomed working image."""
-        ow, oh = self.original.shape[1], self.original.shape[0]
-        ww, wh = self.working.shape[1], self.working.shape[0]
+        """Draw YOLO bboxes scaled to the zoomed working image.
 
-        scale_w = self.zoomed.shape[1] / ww
-        scale_h = self.zoomed.shape[0] / wh
+        Only boxes intersecting the viewport and passing the class filter
+        are drawn. Every box is tagged "bbox", "cls<id>" and "box<idx>" so
+        hover, selection and narrowing the filter can restyle items without
+        a redraw.
+        """
+        zw, zh = self.zoom_w, self.zoom_h
+        cw, ch = self.canvas.winfo_width(), self.canvas.winfo_height()
 
-        for cls, xc, yc, w, h in self.bboxes:
-            # convert YOLO → original px
-            x1 = (xc - w/2) * ow
-            y1 = (yc - h/2) * oh
-            x2 = (xc + w/2) * ow
-            y2 = (yc + h/2) * oh
+        # viewport → normalized image coords
+        visible = self.index.query(self.pan_x / zw, self.pan_y / zh,
+                                   (self.pan_x + cw) / zw, (self.pan_y + ch) / zh,
+                                   self.class_filter)
 
-            # convert original → working
-            dx1 = x1 * (ww / ow)
-            dy1 = y1 * (wh / oh)
-            dx2 = x2 * (ww / ow)
-            dy2 = y2 * (wh / oh)
+        for i in visible:
+            cls, nx1, ny1, nx2, ny2 = self.index.boxes[i]
 
-            # apply zoom
-            zx1 = dx1 * scale_w - self.pan_x
-            zy1 = dy1 * scale_h - self.pan_y
-            zx2 = dx2 * scale_w - self.pan_x
-            zy2 = dy2 * scale_h - self.pan_y
+            # normalized → zoomed canvas px
+            zx1 = nx1 * zw - self.pan_x
+            zy1 = ny1 * zh - self.pan_y
+            zx2 = nx2 * zw - self.pan_x
+            zy2 = ny2 * zh - self.pan_y
+
+            color, width = self.box_style(i)
+            tags = ("bbox", f"cls{cls}", f"box{i}")
 
             # draw rectangle
-            self.canvas.create_rectangle(zx1, zy1, zx2, zy2, outline="red", width=2)
+            self.canvas.create_rectangle(zx1, zy1, zx2, zy2, outline=color, width=width,
+                                         tags=tags + ("outline",))
 
             # draw class id text above the box
             text_x = zx1 + 3
@@ -211,11 +379,83 @@ class FastBBoxViewer:
             self.canvas.create_text(
                 text_x, text_y,
                 text=str(cls),
-                fill="red",
+                fill=color,
                 anchor="nw",
-                font=("Arial", 12, "bold")
+                font=("Arial", 12, "bold"),
+                tags=tags + ("label",)
             )
 
+    def box_style(self, idx):
+        if idx == self.selected:
+            return "yellow", 3
+        if idx == self.hovered:
+            return "cyan", 3
+        return "red", 2
+
+    def restyle_box(self, idx):
+        """Update colour of an already drawn box in place."""
+        if idx is None:
+            return
+        color, width = self.box_style(idx)
+        tag = f"box{idx}"
+        self.canvas.itemconfigure(f"{tag}&&outline", outline=color, width=width)
+        self.canvas.itemconfigure(f"{tag}&&label", fill=color)
+
+    # --------------------------------------------------------------------------
+    # SELECTION & FILTER
+    # --------------------------------------------------------------------------
+
+    def is_visible_class(self, cls):
+        return self.class_filter is None or cls in self.class_filter
+
+    def canvas_to_norm(self, x, y):
+        """Canvas px → normalized (YOLO) image coords."""
+        return ((self.pan_x + x) / self.zoom_w,
+                (self.pan_y + y) / self.zoom_h)
+
+    def set_hovered(self, idx):
+        if idx == self.hovered:
+            return
+        prev, self.hovered = self.hovered, idx
+        self.restyle_box(prev)
+        self.restyle_box(idx)
+
+    def set_selected(self, idx):
+        prev, self.selected = self.selected, idx
+        self.restyle_box(prev)
+        self.restyle_box(idx)
+
+        if idx is None:
+            self.sel_label.config(text="")
+        else:
+            cls, xc, yc, w, h = self.bboxes[idx]
+            self.sel_label.config(text=f"Selected: class {cls} ({xc:.3f}, {yc:.3f}, {w:.3f}, {h:.3f})")
+
+    def on_filter(self, e=None):
+        """Apply the class filter to the overlay.
+
+        Filtered-out boxes are never created, so narrowing the filter just
+        hides items by tag, while widening it needs a redraw to create the
+        boxes that were skipped.
+        """
+        prev = self.class_filter
+        self.class_filter = CLASS_FILTERS[self.filter_var.get()]
+
+        narrowed = prev is None or (self.class_filter is not None and self.class_filter <= prev)
+        if narrowed:
+            if self.class_filter is not None:
+                self.canvas.itemconfigure("bbox", state="hidden")
+                for cls in self.class_filter:
+                    self.canvas.itemconfigure(f"cls{cls}", state="normal")
+        else:
+            self.last_render = 0
+            self.render_view()
+
+        if self.hovered is not None and not self.is_visible_class(self.bboxes[self.hovered][0]):
+            self.set_hovered(None)
+        if self.selected is not None and not self.is_visible_class(self.bboxes[self.selected][0]):
+            self.set_selected(None)
+
 
     # def draw_bboxes(self):
     #     """Draw YOLO bboxes scaled to the zoomed working image."""
@@ -256,6 +496,7 @@ class FastBBoxViewer:
             self.rect_end = self.rect_start
         else:
             self.drag_start = (e.x, e.y)
+            self.click_pos = (e.x, e.y)
 
     def on_drag(self, e):
         if self.annotation_mode:
@@ -267,18 +508,31 @@ class FastBBoxViewer:
             self.pan_x -= dx
             self.pan_y -= dy
             self.drag_start = (e.x, e.y)
+            # cheap frames while panning, refine once the drag settles
+            self.fast = True
+            self.schedule_refine()
             self.render_view()
 
     def on_release(self, e):
         if self.annotation_mode and self.rect_start and self.rect_end:
             self.save_annotation()
+        elif (self.click_pos is not None
+              and abs(e.x - self.click_pos[0]) <= CLICK_TOLERANCE
+              and abs(e.y - self.click_pos[1]) <= CLICK_TOLERANCE):
+            # click without drag → select the box under the cursor
+            self.set_selected(self.index.hit(*self.canvas_to_norm(e.x, e.y), self.class_filter))
         self.drag_start = None
+        self.click_pos = None
+
+    def on_motion(self, e):
+        self.set_hovered(self.index.hit(*self.canvas_to_norm(e.x, e.y), self.class_filter))
 
     def on_scroll(self, event):
+        # cheap resize per wheel step, refine once the burst settles
         if event.delta > 0:
-            self.zoom_in()
+            self.zoom_in(fast=True)
         else:
-            self.zoom_out()
+            self.zoom_out(fast=True)
 
     # --------------------------------------------------------------------------
     # SAVE ANNOTATION
@@ -299,8 +553,8 @@ class FastBBoxViewer:
         ex, ey = self.rect_end
 
         # Convert zoomed coords → working coords
-        scale_w = self.zoomed.shape[1] / ww
-        scale_h = self.zoomed.shape[0] / wh
+        scale_w = self.zoom_w / ww
+        scale_h = self.zoom_h / wh
 
         dx1 = sx / scale_w
         dy1 = sy / scale_h
@@ -327,6 +581,7 @@ class FastBBoxViewer:
             f.write(f"{class_id} {xc:.6f} {yc:.6f} {w:.6f} {h:.6f}\n")
 
         self.bboxes.append((class_id, xc, yc, w, h))
+        self.index.insert(class_id, xc, yc, w, h)
         self.rect_start = None
         self.rect_end = None
         self.render_view()
@@ -351,14 +606,14 @@ class FastBBoxViewer:
         self.rect_start = None
         self.rect_end = None
 
-    def zoom_in(self):
+    def zoom_in(self, fast=False):
         self.zoom *= 1.2
-        self.apply_zoom()
+        self.apply_zoom(fast)
 
-    def zoom_out(self):
+    def zoom_out(self, fast=False):
         self.zoom /= 1.2
         self.zoom = max(0.1, self.zoom)
-        self.apply_zoom()
+        self.apply_zoom(fast)
 
     def reset_view(self):
         self.zoom = 1.0
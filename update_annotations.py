@@ -1,5 +1,4 @@
 import os
-import glob
 # from tqdm import tqdm
 import visualize_annotations
 
@@ -60,22 +59,32 @@ def resolve_overlap(actuator, valve):
     
     return best_candidate
 
-def process_file(filepath, dry_run=False):
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
+LABEL_DIRS = ['tiled_dataset/train/labels', 'tiled_dataset/val/labels']
+CHECKPOINT_PATH = 'update_annotations.checkpoint'
+CHECKPOINT_EVERY = 1000  # files between checkpoint writes
+SCRATCH_SUFFIX = '.tmp'  # labels/ -> labels.tmp/ holds files being rewritten
 
-    annotations = []
+def parse_lines(lines):
+    # Single pass: split annotations into valves, actuators and others
+    valves, actuators, others = [], [], []
     for line in lines:
         parts = line.strip().split()
         if len(parts) != 5: continue
         cls_id = int(parts[0])
         x_c, y_c, w, h = map(float, parts[1:])
-        annotations.append({'cls_id': cls_id, 'bbox': yolo_to_bbox(x_c, y_c, w, h), 'original': line})
-
-    valves = [a for a in annotations if a['cls_id'] in VALVES]
-    actuators = [a for a in annotations if a['cls_id'] in ACTUATORS]
-    others = [a for a in annotations if a['cls_id'] not in VALVES and a['cls_id'] not in ACTUATORS]
+        if not line.endswith('\n'):
+            line += '\n' # last line may lack a newline but won't be last after rewrite
+        ann = {'cls_id': cls_id, 'bbox': yolo_to_bbox(x_c, y_c, w, h), 'original': line}
+        if cls_id in VALVES:
+            valves.append(ann)
+        elif cls_id in ACTUATORS:
+            actuators.append(ann)
+        else:
+            others.append(ann)
+    return valves, actuators, others
 
+def resolve_annotations(filepath, valves, actuators, others):
+    # Returns (modified, output lines)
     new_actuators = []
     modified = False
 
@@ -123,38 +132,143 @@ def process_file(filepath, dry_run=False):
             modified = True # Removed
             print(f"Removed actuator in {filepath} (completely inside valve)")
 
+    lines = [a['original'] for a in valves] + [a['original'] for a in others] + new_actuators
+    return modified, lines
+
+def write_lines(filepath, lines):
+    # Write into a sibling scratch dir (same filesystem) and rename over the
+    # label, so an interrupted run never truncates it and the label dir never
+    # gains or loses entries while discover is scanning it
+    scratch_dir = os.path.dirname(filepath) + SCRATCH_SUFFIX
+    os.makedirs(scratch_dir, exist_ok=True)
+    tmp_path = os.path.join(scratch_dir, os.path.basename(filepath))
+    with open(tmp_path, 'w') as f:
+        f.writelines(lines)
+    os.replace(tmp_path, filepath)
+
+def process_file(filepath, dry_run=False):
+    with open(filepath, 'r') as f:
+        valves, actuators, others = parse_lines(f)
+
+    modified, lines = resolve_annotations(filepath, valves, actuators, others)
     if modified and not dry_run:
-        with open(filepath, 'w') as f:
-            for a in valves:
-                f.write(a['original'])
-            for a in others:
-                f.write(a['original'])
-            for line in new_actuators:
-                f.write(line)
+        write_lines(filepath, lines)
     
     return modified
 
+# ------------------------------------------------------------------------------
+# Streaming pipeline: discover -> read/parse -> resolve -> write -> report
+# Each stage is a generator, so only one file is in flight at a time.
+# ------------------------------------------------------------------------------
+
+def discover(label_dirs, skip=0, last_path=None):
+    # Yield label files as os.scandir finds them, skipping the first `skip`.
+    # When resuming, the file at position `skip` must be `last_path`,
+    # otherwise the scandir order changed since the checkpoint.
+    seen = 0
+    for label_dir in label_dirs:
+        if not os.path.isdir(label_dir): continue
+        with os.scandir(label_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.txt') or not entry.is_file():
+                    continue
+                seen += 1
+                if seen < skip: continue
+                if seen == skip:
+                    if entry.path != last_path:
+                        raise RuntimeError(f"Checkpoint mismatch: expected {last_path} at position {skip}, "
+                                           f"found {entry.path}. Label directories changed since the checkpoint.")
+                    continue
+                yield entry.path
+    if seen < skip:
+        raise RuntimeError(f"Checkpoint mismatch: expected {skip} files but found only {seen}. "
+                           f"Label directories changed since the checkpoint.")
+
+def parse(paths):
+    # The file is read and closed before it reaches the write stage
+    for path in paths:
+        with open(path, 'r') as f:
+            annotations = parse_lines(f)
+        yield (path,) + annotations
+
+def resolve(parsed):
+    for path, valves, actuators, others in parsed:
+        yield (path,) + resolve_annotations(path, valves, actuators, others)
+
+def write(resolved, dry_run=False):
+    for path, modified, lines in resolved:
+        if modified and not dry_run:
+            write_lines(path, lines)
+        yield path, modified
+
+def load_checkpoint(checkpoint_path):
+    # Returns (processed, modified, last path) from an interrupted run
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0, 0, None
+    with open(checkpoint_path, 'r') as f:
+        processed, modified = map(int, f.readline().split())
+        last_path = f.readline().rstrip('\n')
+    return processed, modified, last_path
+
+def save_checkpoint(checkpoint_path, processed, modified, last_path):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(f"{processed} {modified}\n{last_path}\n")
+    os.replace(tmp_path, checkpoint_path) # atomic, never a half-written checkpoint
+
+def report(results, processed=0, modified=0, checkpoint_path=None):
+    for path, was_modified in results:
+        processed += 1
+        if was_modified:
+            modified += 1
+        if processed % CHECKPOINT_EVERY == 0:
+            print(f"Processed {processed} files, modified {modified}...")
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, processed, modified, path)
+    return processed, modified
+
+def run_pipeline(label_dirs, dry_run=False, checkpoint_path=CHECKPOINT_PATH):
+    # Resuming continues after the last checkpointed file. Files processed
+    # after it are run through resolve again; ones already rewritten are
+    # usually found unmodified (or change by rounding only), so after a
+    # resume the modified count is approximate.
+    if dry_run:
+        checkpoint_path = None
+    done, modified, last_path = load_checkpoint(checkpoint_path)
+    if done:
+        print(f"Resuming after {last_path} ({done} files).")
+
+    files = discover(label_dirs, skip=done, last_path=last_path)
+    results = write(resolve(parse(files)), dry_run=dry_run)
+    processed, modified = report(results, done, modified, checkpoint_path)
+
+    for label_dir in label_dirs:
+        scratch_dir = label_dir.rstrip('/') + SCRATCH_SUFFIX
+        if os.path.isdir(scratch_dir) and not os.listdir(scratch_dir):
+            os.rmdir(scratch_dir)
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return processed, modified
+
 def main():
-    # Step 1: Visualize Original
-    print("Visualizing original annotations...")
+    resuming = os.path.exists(CHECKPOINT_PATH)
     yaml_path = 'data.yaml'
     class_names = visualize_annotations.load_class_names(yaml_path)
-    visualize_annotations.process_dataset('train', class_names, suffix='_old')
-    visualize_annotations.process_dataset('val', class_names, suffix='_old')
+
+    # Step 1: Visualize Original
+    if resuming:
+        # Labels are already partly rewritten, the _old images are from the first run
+        print("Checkpoint found, skipping visualization of original annotations.")
+    else:
+        print("Visualizing original annotations...")
+        visualize_annotations.process_dataset('train', class_names, suffix='_old')
+        visualize_annotations.process_dataset('val', class_names, suffix='_old')
 
     # Step 2: Update Annotations
     print("Updating annotations...")
-    train_labels = glob.glob('tiled_dataset/train/labels/*.txt')
-    val_labels = glob.glob('tiled_dataset/val/labels/*.txt')
-    
-    all_files = train_labels + val_labels
-    print(f"Found {len(all_files)} files.")
-    
-    count = 0
-    for f in all_files:
-        if process_file(f, dry_run=False):
-            count += 1
-            
+    processed, count = run_pipeline(LABEL_DIRS)
+    print(f"Processed {processed} files.")
     print(f"Modified {count} files.")
 
     # Step 3: Visualize Updated